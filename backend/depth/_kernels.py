@@ -0,0 +1,87 @@
+"""
+Numba kernels for the per-frame bbox math.
+
+``bbox_median_depth`` is None when numba is not installed; callers fall
+back to their NumPy implementation.  Kernels are compiled with
+``cache=True``, so only the very first run on a machine pays the JIT cost
+(the estimator triggers it at load time).
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:     # optional – callers fall back to NumPy
+    njit = None
+
+# Side of the sample grid placed inside each bbox crop
+GRID_N = 10
+# The two middle ranks of the GRID_N² samples (even count → mean of both)
+MID = (GRID_N * GRID_N // 2 - 1, GRID_N * GRID_N // 2)
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _select(a, k):
+        """In-place quickselect: a[k] becomes the k-th smallest and every
+        element after it is >= a[k]."""
+        lo, hi = 0, a.size - 1
+        while lo < hi:
+            pivot = a[(lo + hi) // 2]
+            i, j = lo, hi
+            while i <= j:
+                while a[i] < pivot:
+                    i += 1
+                while a[j] > pivot:
+                    j -= 1
+                if i <= j:
+                    a[i], a[j] = a[j], a[i]
+                    i += 1
+                    j -= 1
+            if k <= j:
+                hi = j
+            elif k >= i:
+                lo = i
+            else:
+                break
+        return a[k]
+
+    @njit(cache=True, parallel=True)
+    def bbox_median_depth(depth_map, boxes, ox, oy, sx, sy):
+        """
+        Median depth of a GRID_N×GRID_N grid over the central 40 % of each
+        [cx, cy, w, h] box, after mapping frame coordinates onto the map
+        ((x - ox) * sx, (y - oy) * sy).  NaN where the crop is empty.
+        JIT version of DepthEstimator.get_depth_for_bboxes.
+        """
+        h_img, w_img = depth_map.shape
+        n = boxes.shape[0]
+        out = np.empty(n, dtype=np.float64)
+        for b in prange(n):
+            cx = (boxes[b, 0] - ox) * sx
+            cy = (boxes[b, 1] - oy) * sy
+            w = boxes[b, 2] * sx
+            h = boxes[b, 3] * sy
+            x1 = max(0, int(np.rint(cx - w * 0.2)))
+            x2 = min(w_img - 1, int(np.rint(cx + w * 0.2)))
+            y1 = max(0, int(np.rint(cy - h * 0.2)))
+            y2 = min(h_img - 1, int(np.rint(cy + h * 0.2)))
+            if x2 <= x1 or y2 <= y1:
+                out[b] = np.nan
+                continue
+
+            step_x = (x2 - x1) / (GRID_N - 1)
+            step_y = (y2 - y1) / (GRID_N - 1)
+            samples = np.empty(GRID_N * GRID_N, dtype=depth_map.dtype)
+            for i in range(GRID_N):
+                y = y2 if i == GRID_N - 1 else int(i * step_y + y1)
+                for j in range(GRID_N):
+                    x = x2 if j == GRID_N - 1 else int(j * step_x + x1)
+                    samples[i * GRID_N + j] = depth_map[y, x]
+
+            lower = _select(samples, MID[0])
+            upper = samples[MID[1]:].min()
+            out[b] = 0.5 * (float(lower) + float(upper))
+        return out
+else:
+    bbox_median_depth = None
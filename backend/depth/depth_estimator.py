@@ -9,25 +9,78 @@ For each bounding box:
   2. Sample a 10×10 grid of points inside that crop.
   3. Return the median depth of those sampled points.
 
+The ViT can be restricted to the region covered by the detections
+(``compute_depth_map_roi``) or run tile-by-tile at native resolution
+(``compute_depth_map_tiled``); bbox queries are always expressed in
+full-frame coordinates and mapped onto the stored depth map.
+
 NOTE: Values are *relative* depth (0–255 range), NOT metric metres.
-      Higher values ≈ closer to the camera.
+      Higher values ≈ closer to the camera.  The range is that of the
+      last full-frame pass: ROI maps are aligned to it and normalised with
+      its min/max, so ROI and full-frame values share one scale.
 """
 
+import cv2
 import numpy as np
-from PIL import Image
+import torch
 from transformers import pipeline
 
+from ._kernels import GRID_N as _GRID_N, MID as _MID, bbox_median_depth
+
+# ViT input resolution (multiple of the 14-px patch size).  On GPU every
+# input is resized to exactly this size so CUDA graphs are captured once.
+_INPUT_SIZE = 518
+_PATCH = 14
+
+# Fraction of the detections' union box added on each side of the ROI
+_ROI_PAD = 0.2
+# Pixel stride of the ROI → full-frame reference alignment fit
+_ALIGN_STRIDE = 4
+
+# Default tile overlap (px) for compute_depth_map_tiled (5 ViT patches)
+_TILE_OVERLAP = 5 * _PATCH
+
+# Sample indices of the 10×10 grid (positions follow np.linspace exactly)
+_GRID_I = np.arange(_GRID_N)
+
+
+def _tile_starts(n: int, tile: int, overlap: int) -> list[int]:
+    """Tile origins covering [0, n); the last tile is flush with the end."""
+    if n <= tile:
+        return [0]
+    starts = list(range(0, n - tile, tile - overlap))
+    starts.append(n - tile)
+    return starts
+
+
+def _cosine_ramp(n: int, overlap: int) -> np.ndarray:
+    """1-D raised-cosine blend weights: rise over *overlap* px at each end,
+    1 in the middle, never exactly 0."""
+    ramp = np.ones(n, dtype=np.float32)
+    k = min(overlap, n // 2)
+    if k > 0:
+        edge = 0.5 - 0.5 * np.cos(np.pi * (np.arange(k) + 0.5) / k)
+        ramp[:k] = edge
+        ramp[n - k:] = edge[::-1]
+    return ramp
+
 
 class DepthEstimator:
     """Wraps the HF depth-estimation pipeline (ViTS model)."""
 
     def __init__(self, model_name: str = "depth-anything/Depth-Anything-V2-Small-hf",
-                 device: str = "cpu"):
+                 device: str = "cpu", compile_cpu: bool = False,
+                 int8_cpu: bool = False):
         """
         Args:
             model_name: Hugging Face model ID.
             device: 'cpu' or 'cuda:0'.
+            compile_cpu: also torch.compile the model on CPU (always done
+                on GPU).  Costs a few seconds of start-up per input shape.
+            int8_cpu: on CPU, dynamically quantise the ViT's Linear layers
+                to int8 (weights int8, activations quantised per batch).
         """
+        self.device = device
         # Use -1 for CPU, 0 for first GPU
         device_id = -1 if device == "cpu" else int(device.split(":")[-1])
         self.pipe = pipeline(
@@ -36,25 +89,329 @@ class DepthEstimator:
             device=device_id,
         )
         self._depth_map: np.ndarray | None = None
+        # Ping-pong output buffers: each frame is written into the one not
+        # currently exposed as depth_map, so readers never need a copy.
+        self._depth_bufs: list[np.ndarray | None] = [None, None]
+        self._back = 0
+        # frame → depth-map transform: (x - ox) * sx, (y - oy) * sy
+        self._origin = (0, 0)
+        self._scale = (1.0, 1.0)
+        # Raw map of the last full-frame pass, its frame → map scale and
+        # value range: the shared scale ROI maps are normalised against
+        self._ref_raw: np.ndarray | None = None
+        self._ref_scale = (1.0, 1.0)
+        self._ref_range = (0.0, 0.0)
+
+        self._static_input = False
+        self._rgb_buf: np.ndarray | None = None
+        self._pinned: torch.Tensor | None = None
+
+        # FP16 weights + autocast on GPU (tensor cores); FP32 on CPU
+        self._fp16 = device != "cpu"
+        self._dtype = torch.float16 if self._fp16 else torch.float32
+        if self._fp16:
+            self.pipe.model.half()
+
+        # On GPU the input shape is pinned and the forward pass is replayed
+        # from an explicitly captured CUDA graph (see _forward); compile only
+        # fuses kernels so it doesn't capture graphs of its own.
+        self._graph = None
+        self._static_in = None
+        self._static_out = None
+        # Dedicated stream so depth kernels can overlap YOLO's
+        self._stream = None
+        if device != "cpu":
+            self._static_input = True
+            self._stream = torch.cuda.Stream(device=device)
+            if hasattr(torch, "compile"):
+                # Fixed 518×518 input: specialise, never trace dynamic shapes
+                self.pipe.model = torch.compile(
+                    self.pipe.model, mode="max-autotune-no-cudagraphs",
+                    fullgraph=True, dynamic=False)
+        else:
+            if int8_cpu:
+                # The ViT's FLOPs are almost all in Linear (QKV, proj, MLP)
+                self.pipe.model = torch.ao.quantization.quantize_dynamic(
+                    self.pipe.model, {torch.nn.Linear}, dtype=torch.qint8)
+            if compile_cpu and hasattr(torch, "compile"):
+                # ROI sizes vary on CPU: let Inductor go dynamic after the
+                # first recompile instead of specialising on every shape
+                self.pipe.model = torch.compile(self.pipe.model)
+        # Bypass the pipeline wrapper (PIL round-trip) on the hot path
+        self._processor = self.pipe.image_processor
+        self._model = self.pipe.model
+        if self._stream is not None:
+            # Rescale + normalise folded into one multiply-subtract on GPU
+            mean = torch.tensor(self._processor.image_mean, device=device)
+            std = torch.tensor(self._processor.image_std, device=device)
+            self._norm_scale = (self._processor.rescale_factor
+                                / std).view(1, 3, 1, 1)
+            self._norm_shift = (mean / std).view(1, 3, 1, 1)
+        if bbox_median_depth is not None:
+            # Trigger (or load the cached) JIT compilation up front
+            bbox_median_depth(np.zeros((2, 2), dtype=np.float32),
+                              np.zeros((1, 4)), 0, 0, 1.0, 1.0)
+
+    @property
+    def depth_map(self) -> np.ndarray | None:
+        """Latest normalised depth map.  It stays valid (unmodified) until
+        the next-but-one depth computation."""
+        return self._depth_map
 
     def compute_depth_map(self, frame_bgr: np.ndarray):
         """
         Run depth estimation on a full frame (BGR numpy array).
-        Stores the depth map internally for later per-bbox queries.
+        Stores the depth map internally for later per-bbox queries, and
+        makes it the reference scale for subsequent ROI passes.
         """
-        # Convert BGR→RGB and to PIL
-        frame_rgb = frame_bgr[:, :, ::-1]
-        pil_image = Image.fromarray(frame_rgb)
-
-        result = self.pipe(pil_image)
-        # result["depth"] is a PIL image; convert to float array
-        raw = np.array(result["depth"], dtype=np.float32)
-        # Normalize to 0–255 per-frame so values span the full range
-        dmin, dmax = raw.min(), raw.max()
+        self._run(frame_bgr, 0, 0, full=True)
+
+    def compute_depth_map_roi(self, frame_bgr: np.ndarray,
+                              bboxes: list[list[float]]) -> bool:
+        """
+        Run depth estimation only on the union of *bboxes* ([cx, cy, w, h]),
+        padded by ``_ROI_PAD`` and snapped to the ViT patch grid.  Fewer
+        pixels → fewer ViT tokens, so small ROIs are much cheaper than the
+        full frame.
+
+        The ROI prediction is aligned to the last full-frame pass and
+        normalised with its range (see _store); without one yet, the full
+        frame is run instead.  Returns True when a full-frame pass ran
+        (i.e. the reference scale changed).
+        """
+        if not bboxes or self._ref_raw is None:
+            self.compute_depth_map(frame_bgr)
+            return True
+
+        h_img, w_img = frame_bgr.shape[:2]
+        boxes = np.asarray(bboxes, dtype=np.float32)
+        x1 = float((boxes[:, 0] - boxes[:, 2] / 2.0).min())
+        y1 = float((boxes[:, 1] - boxes[:, 3] / 2.0).min())
+        x2 = float((boxes[:, 0] + boxes[:, 2] / 2.0).max())
+        y2 = float((boxes[:, 1] + boxes[:, 3] / 2.0).max())
+        pad_w = (x2 - x1) * _ROI_PAD
+        pad_h = (y2 - y1) * _ROI_PAD
+
+        # Snap outward to the patch grid, then clamp to the frame
+        x1 = max(0, int(x1 - pad_w) // _PATCH * _PATCH)
+        y1 = max(0, int(y1 - pad_h) // _PATCH * _PATCH)
+        x2 = min(w_img, -(-int(x2 + pad_w) // _PATCH) * _PATCH)
+        y2 = min(h_img, -(-int(y2 + pad_h) // _PATCH) * _PATCH)
+
+        if x2 - x1 < _PATCH or y2 - y1 < _PATCH:
+            self.compute_depth_map(frame_bgr)
+            return True
+
+        self._run(frame_bgr[y1:y2, x1:x2], x1, y1, full=False)
+        return False
+
+    def compute_depth_map_tiled(self, frame_bgr: np.ndarray,
+                                tile: int = _INPUT_SIZE,
+                                overlap: int = _TILE_OVERLAP):
+        """
+        Run depth estimation on overlapping tile×tile crops of the frame at
+        native resolution and stitch them into one full-frame map.
+
+        Each tile's relative depth is least-squares aligned (scale + shift)
+        to the tiles already placed, using their overlap, then blended in
+        with a raised-cosine window so no seams show.  Peak ViT memory is
+        bounded by the tile size instead of the frame size.
+        """
+        h, w = frame_bgr.shape[:2]
+        acc = np.zeros((h, w), dtype=np.float32)
+        weight = np.zeros((h, w), dtype=np.float32)
+        th, tw = min(tile, h), min(tile, w)
+        window = np.outer(_cosine_ramp(th, overlap), _cosine_ramp(tw, overlap))
+
+        for y0 in _tile_starts(h, th, overlap):
+            for x0 in _tile_starts(w, tw, overlap):
+                pred = self._predict(frame_bgr[y0:y0 + th, x0:x0 + tw])
+                if pred.shape != (th, tw):
+                    pred = cv2.resize(pred, (tw, th),
+                                      interpolation=cv2.INTER_LINEAR)
+                acc_t = acc[y0:y0 + th, x0:x0 + tw]
+                weight_t = weight[y0:y0 + th, x0:x0 + tw]
+
+                seen = weight_t > 0
+                if seen.any():
+                    # Fit pred ≈ mosaic on the overlap: a * pred + b
+                    ref = acc_t[seen] / weight_t[seen]
+                    src = pred[seen]
+                    a, b = np.polyfit(src, ref, 1)
+                    if a > 0:
+                        pred = pred * np.float32(a) + np.float32(b)
+
+                acc_t += pred * window
+                weight_t += window
+
+        np.divide(acc, weight, out=acc)
+        self._store(acc, 0, 0, w, h, full=True)
+
+    def _input_size(self, h: int, w: int) -> tuple[int, int]:
+        """ViT input (height, width) for an h×w image."""
+        if self._static_input:
+            return _INPUT_SIZE, _INPUT_SIZE
+        # Longer side to at most _INPUT_SIZE (ViT cost grows with the token
+        # count); never upscale.  The map stays at this size – bbox queries
+        # are mapped onto it via _scale instead of upsampling it back.
+        scale = min(1.0, _INPUT_SIZE / max(h, w))
+        return (max(_PATCH, round(h * scale / _PATCH) * _PATCH),
+                max(_PATCH, round(w * scale / _PATCH) * _PATCH))
+
+    def _run(self, image_bgr: np.ndarray, ox: int, oy: int, full: bool):
+        """Infer depth on *image_bgr*, whose top-left is (ox, oy) in the frame."""
+        h, w = image_bgr.shape[:2]
+        self._store(self._predict(image_bgr), ox, oy, w, h, full)
+
+    def _predict(self, image_bgr: np.ndarray) -> np.ndarray:
+        """Raw (un-normalised) ViT depth for *image_bgr* at ViT input size."""
+        h, w = image_bgr.shape[:2]
+        in_h, in_w = self._input_size(h, w)
+
+        with torch.inference_mode(), torch.cuda.stream(self._stream):
+            if self._stream is not None:
+                pixel_values = self._preprocess_gpu(image_bgr, in_h, in_w)
+            else:
+                pixel_values = self._preprocess_cpu(image_bgr, in_h, in_w)
+            # The autocast cache must be off for CUDA graph capture
+            with torch.autocast(device_type="cuda", dtype=torch.float16,
+                                enabled=self._fp16, cache_enabled=False):
+                pred = self._forward(pixel_values)
+                if pred.shape[-2:] != (in_h, in_w):
+                    pred = torch.nn.functional.interpolate(
+                        pred.unsqueeze(1), size=(in_h, in_w),
+                        mode="bicubic", align_corners=False,
+                    ).squeeze(1)
+                return pred[0].float().cpu().numpy()
+
+    def _preprocess_cpu(self, image_bgr: np.ndarray,
+                        in_h: int, in_w: int) -> torch.Tensor:
+        """Resize + BGR→RGB with OpenCV, normalise with the HF processor."""
+        # Resizing is done here rather than in the processor so small ROIs
+        # are never upscaled
+        if (in_h, in_w) != image_bgr.shape[:2]:
+            image_bgr = cv2.resize(image_bgr, (in_w, in_h),
+                                   interpolation=cv2.INTER_CUBIC)
+
+        # BGR→RGB into a reusable contiguous buffer
+        if self._rgb_buf is None or self._rgb_buf.shape[:2] != (in_h, in_w):
+            self._rgb_buf = np.empty((in_h, in_w, 3), dtype=np.uint8)
+        cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB, dst=self._rgb_buf)
+
+        inputs = self._processor(images=self._rgb_buf, do_resize=False,
+                                 return_tensors="pt")
+        return inputs["pixel_values"]
+
+    def _preprocess_gpu(self, image_bgr: np.ndarray,
+                        in_h: int, in_w: int) -> torch.Tensor:
+        """Upload the raw uint8 image once and do channel flip, resize and
+        normalisation on the GPU (same maths as _preprocess_cpu)."""
+        h, w = image_bgr.shape[:2]
+        # Pinned staging buffer → async H2D; the previous frame's copy has
+        # completed by now (each _predict ends with a .cpu() sync)
+        if self._pinned is None or tuple(self._pinned.shape) != (h, w, 3):
+            self._pinned = torch.empty((h, w, 3), dtype=torch.uint8,
+                                       pin_memory=True)
+        self._pinned.numpy()[...] = image_bgr
+        x = self._pinned.to(self.device, non_blocking=True)
+
+        # HWC BGR uint8 → NCHW RGB float
+        x = x.permute(2, 0, 1).flip(0).unsqueeze(0).float()
+        if (in_h, in_w) != (h, w):
+            x = torch.nn.functional.interpolate(
+                x, size=(in_h, in_w), mode="bicubic", align_corners=False,
+            ).clamp_(0.0, 255.0)
+        x = x.mul_(self._norm_scale).sub_(self._norm_shift)
+        return x.contiguous(memory_format=torch.channels_last)
+
+    def _store(self, raw: np.ndarray, ox: int, oy: int, w: int, h: int,
+               full: bool):
+        """Normalise *raw* into the back depth buffer and publish it as the
+        map for the w×h frame region whose top-left is (ox, oy).
+
+        A *full* frame map becomes the reference and spans 0–255.  An ROI
+        map is first fitted (scale + shift) to the reference over the same
+        region, then normalised with the reference range and clipped, so a
+        lone object is not stretched to 0–255 within its own crop."""
+        buf = self._depth_bufs[self._back]
+        if buf is None or buf.shape != raw.shape:
+            buf = self._depth_bufs[self._back] = np.empty_like(raw)
+
+        if full:
+            self._ref_raw = raw
+            self._ref_scale = (raw.shape[1] / w, raw.shape[0] / h)
+            self._ref_range = (float(raw.min()), float(raw.max()))
+        else:
+            raw = self._align_to_ref(raw, ox, oy, w, h)
+
+        dmin, dmax = self._ref_range
         if dmax > dmin:
-            self._depth_map = (raw - dmin) / (dmax - dmin) * 255.0
+            np.subtract(raw, dmin, out=buf)
+            buf *= 255.0 / (dmax - dmin)
+            if not full:
+                np.clip(buf, 0.0, 255.0, out=buf)
         else:
-            self._depth_map = np.zeros_like(raw)
+            buf.fill(0.0)
+        self._depth_map = buf
+        self._back ^= 1
+        self._origin = (ox, oy)
+        self._scale = (raw.shape[1] / w, raw.shape[0] / h)
+
+    def _align_to_ref(self, raw: np.ndarray, ox: int, oy: int,
+                      w: int, h: int) -> np.ndarray:
+        """Least-squares fit a * raw + b to the reference map resampled
+        over the same w×h frame region (the ViT's relative depth has a
+        per-input scale and shift); *raw* unchanged if the fit fails."""
+        sx, sy = self._ref_scale
+        x1, y1 = int(ox * sx), int(oy * sy)
+        x2, y2 = int(round((ox + w) * sx)), int(round((oy + h) * sy))
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return raw
+        ref = cv2.resize(self._ref_raw[y1:y2, x1:x2],
+                         (raw.shape[1], raw.shape[0]),
+                         interpolation=cv2.INTER_LINEAR)
+        src = raw[::_ALIGN_STRIDE, ::_ALIGN_STRIDE].ravel()
+        dst = ref[::_ALIGN_STRIDE, ::_ALIGN_STRIDE].ravel()
+        if src.size < 2 or src.min() == src.max():
+            return raw
+        a, b = np.polyfit(src, dst, 1)
+        if a <= 0:
+            return raw
+        return raw * np.float32(a) + np.float32(b)
+
+    def _forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        """Run the ViT on a (1, 3, H, W) normalised pixel tensor (on the
+        device when _preprocess_gpu made it); returns predicted depth."""
+        if not self._static_input:
+            return self._model(
+                pixel_values=pixel_values.to(self.device, dtype=self._dtype)
+            ).predicted_depth
+
+        if self._graph is None:
+            self._capture_graph()
+        # Device-to-device copy (+ cast to the model dtype) of the
+        # already-normalised input into the graph's persistent buffer
+        self._static_in.copy_(pixel_values)
+        self._graph.replay()
+        return self._static_out
+
+    def _capture_graph(self):
+        """Capture the fixed-shape forward pass into a CUDA graph."""
+        self._static_in = torch.zeros((1, 3, _INPUT_SIZE, _INPUT_SIZE),
+                                      device=self.device, dtype=self._dtype)
+
+        # Warm up on a side stream (cuDNN autotune, lazy allocations)
+        side = torch.cuda.Stream(device=self.device)
+        side.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(side):
+            for _ in range(2):
+                self._model(pixel_values=self._static_in)
+        torch.cuda.current_stream(self.device).wait_stream(side)
+
+        self._graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(self._graph):
+            self._static_out = self._model(
+                pixel_values=self._static_in).predicted_depth
 
     def get_depth_for_bbox(self, bbox: list[float]) -> float | None:
         """
@@ -69,39 +426,56 @@ class DepthEstimator:
         Returns:
             Median depth (float) or None if depth map is not available.
         """
-        if self._depth_map is None:
-            return None
+        # Single-box case of the vectorised / JIT path
+        depth = float(self.get_depth_for_bboxes([bbox])[0])
+        return None if np.isnan(depth) else depth
+
+    def get_depth_for_bboxes(self, bboxes: list[list[float]]) -> np.ndarray:
+        """
+        Vectorised ``get_depth_for_bbox`` for N boxes ([cx, cy, w, h] each).
+
+        Uses the Numba kernel when numba is installed; otherwise all N
+        10×10 grids are gathered with a single NumPy fancy-index.
+
+        Returns:
+            (N,) float array of median depths; NaN where the depth map is
+            not available or the crop is empty.
+        """
+        boxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        n = len(boxes)
+        if self._depth_map is None or n == 0:
+            return np.full(n, np.nan)
+
+        (ox, oy), (sx, sy) = self._origin, self._scale
+        if bbox_median_depth is not None:
+            return bbox_median_depth(self._depth_map, boxes, ox, oy, sx, sy)
 
         h_img, w_img = self._depth_map.shape[:2]
-        cx, cy, w, h = bbox
-
-        # Convert xywh (center) → xyxy (top-left, bottom-right)
-        x1 = cx - w / 2.0
-        y1 = cy - h / 2.0
-        x2 = cx + w / 2.0
-        y2 = cy + h / 2.0
-
-        # Remove 30 % on each side of width AND height → keep central 40 %
-        margin_w = w * 0.3
-        margin_h = h * 0.3
-        x1_crop = x1 + margin_w
-        x2_crop = x2 - margin_w
-        y1_crop = y1 + margin_h
-        y2_crop = y2 - margin_h
-
-        # Clamp to image bounds
-        x1_crop = max(0, int(round(x1_crop)))
-        x2_crop = min(w_img - 1, int(round(x2_crop)))
-        y1_crop = max(0, int(round(y1_crop)))
-        y2_crop = min(h_img - 1, int(round(y2_crop)))
-
-        if x2_crop <= x1_crop or y2_crop <= y1_crop:
-            return None
-
-        # Sample a 10×10 grid
-        xs = np.linspace(x1_crop, x2_crop, 10, dtype=int)
-        ys = np.linspace(y1_crop, y2_crop, 10, dtype=int)
-        grid_x, grid_y = np.meshgrid(xs, ys)
-
-        sampled = self._depth_map[grid_y.ravel(), grid_x.ravel()]
-        return float(np.median(sampled))
+        cx = (boxes[:, 0] - ox) * sx
+        cy = (boxes[:, 1] - oy) * sy
+        w = boxes[:, 2] * sx
+        h = boxes[:, 3] * sy
+
+        # Central 40 % crop (30 % margin on each side), clamped to the map.
+        # np.rint (round-half-even, like round()) + np.clip on int arrays.
+        x1c = np.clip(np.rint(cx - w * 0.2).astype(np.int32), 0, w_img - 1)
+        x2c = np.clip(np.rint(cx + w * 0.2).astype(np.int32), 0, w_img - 1)
+        y1c = np.clip(np.rint(cy - h * 0.2).astype(np.int32), 0, h_img - 1)
+        y2c = np.clip(np.rint(cy + h * 0.2).astype(np.int32), 0, h_img - 1)
+        valid = (x2c > x1c) & (y2c > y1c)
+
+        xs = (_GRID_I * ((x2c - x1c) / (_GRID_N - 1))[:, None]
+              + x1c[:, None]).astype(np.int32)
+        ys = (_GRID_I * ((y2c - y1c) / (_GRID_N - 1))[:, None]
+              + y1c[:, None]).astype(np.int32)
+        xs[:, -1] = x2c
+        ys[:, -1] = y2c
+        # Invalid boxes may index out of range – point them at (0, 0)
+        xs[~valid] = 0
+        ys[~valid] = 0
+
+        sampled = self._depth_map[ys[:, :, None], xs[:, None, :]]   # (N,10,10)
+        p = np.partition(sampled.reshape(n, -1), _MID, axis=1)
+        depths = 0.5 * (p[:, _MID[0]].astype(np.float64) + p[:, _MID[1]])
+        depths[~valid] = np.nan
+        return depths
@@ -8,22 +8,48 @@ Architecture (decoupled):
                        always holds the latest frame.
   • AI thread        – grabs latest frame, runs YOLO + ViTS (~15 FPS),
                        stores detections + depth heatmap in shared state.
+                       On GPU the ViTS runs concurrently with YOLO on a
+                       worker thread with its own CUDA stream.
   • Debug publisher  – runs at ~30 FPS, grabs latest frame, overlays
-                       the *last known* bboxes persistently, publishes
-                       annotated + heatmap on ai/debug.
+                       the *last known* bboxes persistently, and hands
+                       annotated + heatmap to a small thread pool that
+                       JPEG-encodes and publishes them as raw bytes on
+                       ai/debug/annotated and ai/debug/depth.
 """
 
+import os
+import struct
 import time
-import json
-import base64
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+# ── CPU thread partitioning ──────────────────────────────────────
+# OpenCV (debug thread) and PyTorch (AI thread) each default to one worker
+# per core and oversubscribe the CPU.  Split the cores instead; OpenMP
+# reads its variable at import time, so set it before torch is imported.
+_CV_THREADS = 2
+_TORCH_THREADS = max(1, (os.cpu_count() or 1) - _CV_THREADS)
+os.environ.setdefault("OMP_NUM_THREADS", str(_TORCH_THREADS))
+
 import cv2
 import numpy as np
+import orjson
 import paho.mqtt.client as mqtt
+import torch
+
+try:
+    import av                      # optional: low-latency FFmpeg demux/decode
+except ImportError:
+    av = None
 
 from .detector import ObjectDetector
 from .depth_estimator import DepthEstimator
 
+cv2.setNumThreads(_CV_THREADS)
+torch.set_num_threads(_TORCH_THREADS)
+
 # Colors for bounding boxes per class (BGR)
 _CLASS_COLORS = {
     "person":        (107, 107, 255),   # red-ish
@@ -38,11 +64,28 @@ _CLASS_COLORS = {
 
 # ── Target debug FPS (how often we publish annotated frames) ─────
 _DEBUG_FPS = 30
+# Debug images are downscaled to this (w, h) before JPEG encoding
+_DEBUG_SIZE = (320, 240)
+# Encode/publish jobs in flight before the oldest queued one is dropped
+_MAX_PENDING_PUBLISHES = 4
+
+# Depth memoisation per track: reuse a track's last depth while its bbox
+# moved less than _CACHE_MOVE_PX (center and size) and the value is younger
+# than _CACHE_MAX_AGE AI frames.
+_CACHE_MOVE_PX = 5.0
+_CACHE_MAX_AGE = 15
+# CPU ROI depth: rerun the full frame at least every this many AI frames,
+# refreshing the reference scale ROI maps are normalised against
+_FULL_DEPTH_EVERY = 15
 
 
 def _annotate_frame(frame: np.ndarray, detections: list) -> np.ndarray:
-    """Draw bboxes with class, id, and distance on a copy of the frame."""
-    vis = frame.copy()
+    """Draw bboxes with class, id, and distance on the frame *in place*.
+
+    Callers pass the private copy returned by _FrameGrabber.get_latest(),
+    so no further copy is needed.
+    """
+    vis = frame
     for det in detections:
         cx, cy, w, h = det["bbox"]
         x1 = int(cx - w / 2)
@@ -69,38 +112,97 @@ def _annotate_frame(frame: np.ndarray, detections: list) -> np.ndarray:
     return vis
 
 
+_BLANK_HEATMAP = np.zeros((_DEBUG_SIZE[1], _DEBUG_SIZE[0], 3), dtype=np.uint8)
+
+
 def _depth_to_heatmap(depth_map: np.ndarray) -> np.ndarray:
-    """Convert a float32 depth map to a BGR colormap image."""
+    """Convert a float32 depth map to a _DEBUG_SIZE BGR colormap image.
+
+    The single-channel map is downscaled first (nearest-neighbour: a
+    gather, no filtering – plenty for a debug view), so the uint8
+    conversion and the colormap LUT only touch _DEBUG_SIZE pixels.  The
+    estimator already normalises depth to 0–255, so a single saturating
+    float→uint8 pass feeds the LUT directly.
+    """
     if depth_map is None:
-        return np.zeros((480, 640, 3), dtype=np.uint8)
-    norm = cv2.normalize(depth_map, None, 0, 255, cv2.NORM_MINMAX)
-    gray = norm.astype(np.uint8)
-    return cv2.applyColorMap(gray, cv2.COLORMAP_MAGMA)
+        return _BLANK_HEATMAP
+    small = cv2.resize(depth_map, _DEBUG_SIZE, interpolation=cv2.INTER_NEAREST)
+    return cv2.applyColorMap(cv2.convertScaleAbs(small), cv2.COLORMAP_MAGMA)
 
 
-def _encode_jpeg_b64(image: np.ndarray, quality: int = 60) -> str:
-    """Encode a BGR image to a base64 JPEG string."""
+def _encode_jpeg(image: np.ndarray, quality: int = 60) -> bytes:
+    """Encode a BGR image to raw JPEG bytes (published as a binary payload)."""
     _, buf = cv2.imencode(".jpg", image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
-    return base64.b64encode(buf.tobytes()).decode("ascii")
+    return buf.tobytes()
+
+
+_pc = time.perf_counter_ns
+
+
+def _timed(fn, *args) -> int:
+    """Call fn(*args) and return the elapsed time in nanoseconds."""
+    t0 = _pc()
+    fn(*args)
+    return _pc() - t0
+
+
+# PyAV demuxer options: no probe/demux buffering, decode frames as they arrive
+_AV_OPTIONS = {"fflags": "nobuffer", "flags": "low_delay"}
+# OpenCV path: a grab() faster than this came from the buffer, not the wire
+_DRAIN_S = 0.002
 
 
 class _FrameGrabber:
     """Continuously reads frames in a background thread, always providing
-    the most recent one.  This avoids OpenCV buffer lag on MJPEG streams."""
+    the most recent one.  This avoids OpenCV buffer lag on MJPEG streams.
+
+    Uses PyAV when installed (unbuffered FFmpeg demux, frames decoded
+    straight to BGR ndarrays); otherwise OpenCV's FFmpeg backend."""
 
     def __init__(self, url: str):
         self.url = url
-        self._cap = cv2.VideoCapture(url)
+        self._container = None
+        self._cap = None
+        if av is not None:
+            self._container = self._open_av()
+        else:
+            # FFmpeg backend: the MJPEG demux/decode runs in FFmpeg rather
+            # than a Python loop.  BUFFERSIZE is best-effort – the FFmpeg
+            # backend ignores it (set() returns False) – so staleness is
+            # bounded by the grab-drain in _loop, not by OpenCV.
+            self._cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+            self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         self._lock = threading.Lock()
         self._frame = None
         self._ret = False
         self._running = True
-        self._thread = threading.Thread(target=self._loop, daemon=True)
+        target = self._loop_av if av is not None else self._loop
+        self._thread = threading.Thread(target=target, daemon=True)
         self._thread.start()
 
+    def _open_av(self):
+        try:
+            return av.open(self.url, options=_AV_OPTIONS, timeout=5.0)
+        except av.error.FFmpegError:
+            return None
+
     def _loop(self):
         while self._running:
-            ret, frame = self._cap.read()
+            t0 = time.perf_counter()
+            if not self._cap.grab():
+                time.sleep(0.1)
+                continue
+            # Drain frames already queued in FFmpeg: a grab that returns
+            # in under _DRAIN_S was buffered, so skip to the freshest one.
+            # A slow grab waited on the wire – that frame is the freshest,
+            # and grabbing again would block a frame period and drop it.
+            buffered = time.perf_counter() - t0 < _DRAIN_S
+            while buffered:
+                t0 = time.perf_counter()
+                if not self._cap.grab():
+                    break
+                buffered = time.perf_counter() - t0 < _DRAIN_S
+            ret, frame = self._cap.retrieve()
             if not ret:
                 time.sleep(0.1)
                 continue
@@ -108,7 +210,32 @@ class _FrameGrabber:
                 self._ret = ret
                 self._frame = frame
 
+    def _loop_av(self):
+        container = self._container
+        while self._running:
+            if container is None:
+                time.sleep(0.1)
+                container = self._container = self._open_av()
+                continue
+            try:
+                for av_frame in container.decode(video=0):
+                    frame = av_frame.to_ndarray(format="bgr24")
+                    with self._lock:
+                        self._ret = True
+                        self._frame = frame
+                    if not self._running:
+                        break
+            except av.error.FFmpegError:
+                pass
+            # Stream ended or dropped – reopen
+            container.close()
+            container = self._container = None
+        if container is not None:
+            container.close()
+
     def is_opened(self) -> bool:
+        if av is not None:
+            return self._container is not None
         return self._cap.isOpened()
 
     def get_latest(self):
@@ -122,6 +249,89 @@ class _FrameGrabber:
         self._running = False
         if self._cap is not None:
             self._cap.release()
+        # A PyAV container is closed by _loop_av once it sees _running
+
+
+# Raw-frame shared memory written by device/camera_stream.py --shm:
+# header (seq, height, width) followed by height*width*3 BGR bytes.
+# seq is odd while the device is writing a frame (seqlock).
+_SHM_SCHEME = "shm://"
+_SHM_HEADER = struct.Struct("<QII")
+# No new frame for this long → remap the block by name (the device may have
+# restarted and recreated it, orphaning our mapping)
+_SHM_STALE_S = 2.0
+
+
+class _ShmFrameGrabber:
+    """_FrameGrabber for ``shm://<name>`` URLs (streamer on the same host):
+    copies the latest raw frame out of shared memory, so there is no JPEG
+    encode/decode or loopback HTTP.  No background thread is needed; the AI
+    and debug threads both call get_latest(), so reads and re-attaching
+    are serialised by a lock (closing the block while the other thread
+    still holds a view of it would fail)."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._name = url[len(_SHM_SCHEME):]
+        self._lock = threading.Lock()
+        self._shm = None
+        self._last_seq = 0
+        self._last_change = time.monotonic()
+        self._attach()
+
+    def _attach(self):
+        """(Re)map the named block; _shm stays None while it doesn't exist.
+        Called with _lock held (or before the grabber is shared)."""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+        try:
+            shm = shared_memory.SharedMemory(name=self._name)
+        except FileNotFoundError:
+            return
+        # Only attached: don't let this process's resource tracker unlink
+        # the device's block at exit
+        resource_tracker.unregister(shm._name, "shared_memory")
+        self._shm = shm
+
+    def is_opened(self) -> bool:
+        return self._shm is not None
+
+    def get_latest(self):
+        """Return (True, frame) for the most recent frame, or (False, None)."""
+        with self._lock:
+            return self._read_latest()
+
+    def _read_latest(self):
+        now = time.monotonic()
+        if now - self._last_change > _SHM_STALE_S:
+            # seq stuck (or no block yet): a restarted device unlinks and
+            # recreates the segment, so look it up by name again
+            self._last_change = now
+            self._attach()
+        if self._shm is None:
+            return False, None
+        buf = self._shm.buf
+        off = _SHM_HEADER.size
+        for _ in range(3):
+            seq, h, w = _SHM_HEADER.unpack_from(buf, 0)
+            if seq == 0 or seq & 1:
+                time.sleep(0.001)     # no frame yet / write in progress
+                continue
+            frame = np.frombuffer(buf, dtype=np.uint8, count=h * w * 3,
+                                  offset=off).reshape(h, w, 3).copy()
+            if _SHM_HEADER.unpack_from(buf, 0)[0] == seq:
+                if seq != self._last_seq:
+                    self._last_seq = seq
+                    self._last_change = now
+                return True, frame
+        return False, None
+
+    def stop(self):
+        with self._lock:
+            if self._shm is not None:
+                self._shm.close()
+                self._shm = None
 
 
 class VisionPipeline:
@@ -138,15 +348,48 @@ class VisionPipeline:
         yolo_model: str = "yolo11n.pt",
         depth_model: str = "depth-anything/Depth-Anything-V2-Small-hf",
         device: str = "cpu",
+        yolo_imgsz: int = 416,
+        export_yolo: bool = True,
+        yolo_int8: bool = False,
+        yolo_int8_data: str | None = None,
+        depth_tiling: bool = False,
+        compile_depth_cpu: bool = False,
+        depth_int8_cpu: bool = False,
     ):
         self.stream_url = stream_url
         self.mqtt = mqtt_client
 
         print("[pipeline] Loading YOLO model …")
-        self.detector = ObjectDetector(model_name=yolo_model, device=device)
+        self.detector = ObjectDetector(model_name=yolo_model, device=device,
+                                       imgsz=yolo_imgsz, export=export_yolo,
+                                       int8=yolo_int8,
+                                       int8_data=yolo_int8_data)
 
         print("[pipeline] Loading depth model (ViTS) …")
-        self.estimator = DepthEstimator(model_name=depth_model, device=device)
+        self.estimator = DepthEstimator(model_name=depth_model, device=device,
+                                        compile_cpu=compile_depth_cpu,
+                                        int8_cpu=depth_int8_cpu)
+        # Full-frame ViTS: one resized pass, or native-resolution tiles
+        self._depth_tiling = depth_tiling
+        self._full_depth = (self.estimator.compute_depth_map_tiled
+                            if depth_tiling else
+                            self.estimator.compute_depth_map)
+
+        # On GPU, YOLO and ViTS run concurrently on separate CUDA streams;
+        # ViTS is driven from a worker thread since both calls block.
+        self._yolo_stream = None
+        self._depth_pool = None
+        if device != "cpu":
+            self._yolo_stream = torch.cuda.Stream(device=device)
+            self._depth_pool = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="pipeline-depth")
+
+        self._warmup()
+
+        # Debug JPEG encode + publish runs off the debug loop
+        self._publish_pool = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="pipeline-publish")
+        self._pending_publishes: deque = deque()
 
         self._running = False
         self._grabber = None
@@ -156,6 +399,21 @@ class VisionPipeline:
         self._last_detections: list = []       # latest detections with distance
         self._last_depth_map = None            # latest depth map (np.ndarray)
 
+        # track id → (bbox, distance, frame index) – AI thread only
+        self._depth_cache: dict[int, tuple[list, float | None, int]] = {}
+
+    def _warmup(self, runs: int = 3):
+        """Run a few dummy frames through YOLO and ViTS so cuDNN autotune,
+        JIT compilation and allocator growth happen before the stream
+        is opened rather than on the first real frames."""
+        print("[pipeline] Warming up models …")
+        dummy = np.zeros((480, 640, 3), dtype=np.uint8)
+        with torch.inference_mode():
+            for _ in range(runs):
+                with torch.cuda.stream(self._yolo_stream):
+                    self.detector.track(dummy)
+                self._full_depth(dummy)
+
     # ────────────────────────────────────────────────────────────
     #  Public API
     # ────────────────────────────────────────────────────────────
@@ -164,13 +422,16 @@ class VisionPipeline:
         self._running = True
 
         # Wait for the camera stream to become available
+        grabber_cls = (_ShmFrameGrabber
+                       if self.stream_url.startswith(_SHM_SCHEME)
+                       else _FrameGrabber)
         print(f"[pipeline] Waiting for stream: {self.stream_url}")
-        self._grabber = _FrameGrabber(self.stream_url)
+        self._grabber = grabber_cls(self.stream_url)
         while not self._grabber.is_opened() and self._running:
             print("[pipeline] Stream not available – retrying in 3 s…")
             self._grabber.stop()
             time.sleep(3)
-            self._grabber = _FrameGrabber(self.stream_url)
+            self._grabber = grabber_cls(self.stream_url)
 
         if not self._running:
             self._grabber.stop()
@@ -196,6 +457,9 @@ class VisionPipeline:
             self._running = False
             ai_thread.join(timeout=5)
             debug_thread.join(timeout=5)
+            if self._depth_pool is not None:
+                self._depth_pool.shutdown(wait=False)
+            self._publish_pool.shutdown(wait=False, cancel_futures=True)
             self._grabber.stop()
             print("[pipeline] Stopped.")
 
@@ -207,10 +471,10 @@ class VisionPipeline:
     # ────────────────────────────────────────────────────────────
     def _ai_loop(self):
         frame_count = 0
+        last_full = -_FULL_DEPTH_EVERY     # AI frame of the last full pass
         LOG_INTERVAL = 30
-        acc_yolo = 0.0
-        acc_depth = 0.0
-        acc_total = 0.0
+        # (yolo, depth, total) ns of the last LOG_INTERVAL frames
+        timings: deque = deque(maxlen=LOG_INTERVAL)
 
         while self._running:
             ret, frame = self._grabber.get_latest()
@@ -218,47 +482,80 @@ class VisionPipeline:
                 time.sleep(0.05)
                 continue
 
-            t_start = time.time()
+            t_start = _pc()
 
             # ── 1. YOLO detection + tracking ─────────────────
-            t_yolo = time.time()
-            detections = self.detector.track(frame)
-            dt_yolo = time.time() - t_yolo
-
-            # ── 2. Depth estimation (skip when no detections) ─
-            dt_depth = 0.0
-            if detections:
-                t_depth = time.time()
-                self.estimator.compute_depth_map(frame)
-                for det in detections:
-                    depth = self.estimator.get_depth_for_bbox(det["bbox"])
-                    det["distance"] = round(depth, 2) if depth is not None else None
-                dt_depth = time.time() - t_depth
+            # (full-frame ViTS overlaps it on GPU)
+            depth_job = None
+            if self._depth_pool is not None:
+                depth_job = self._depth_pool.submit(
+                    _timed, self._full_depth, frame)
+
+            t_yolo = _pc()
+            with torch.cuda.stream(self._yolo_stream):
+                detections = self.detector.track(frame)
+            dt_yolo = _pc() - t_yolo
+
+            # ── 2. Depth estimation ──────────────────────────
+            # CPU: ROI of the tracks without a fresh cached depth only;
+            # skipped entirely when every track is stable.  A full frame
+            # (tiled, or due for a reference refresh) is run instead when
+            # needed, so ROI values keep a full-frame scale.
+            dt_depth = 0
+            full = depth_job is not None
+            if full:
+                dt_depth = depth_job.result()
+                stale = detections
+            else:
+                stale = [det for det in detections
+                         if not self._use_cached_depth(det, frame_count)]
+            if stale:
+                t_depth = _pc()
+                bboxes = [det["bbox"] for det in stale]
+                if not full and (self._depth_tiling or
+                                 frame_count - last_full >= _FULL_DEPTH_EVERY):
+                    self._full_depth(frame)
+                    last_full = frame_count
+                    full = True
+                elif not full:
+                    full = self.estimator.compute_depth_map_roi(frame, bboxes)
+                    if full:
+                        last_full = frame_count
+                if full:
+                    # New reference scale: cached distances were normalised
+                    # against the previous one, so refresh every track
+                    self._depth_cache.clear()
+                    stale = detections
+                    bboxes = [det["bbox"] for det in stale]
+                depths = self.estimator.get_depth_for_bboxes(bboxes)
+                for det, depth in zip(stale, depths.tolist()):
+                    det["distance"] = None if np.isnan(depth) else round(depth, 2)
+                    self._depth_cache[det["id"]] = (
+                        det["bbox"], det["distance"], frame_count)
+                dt_depth += _pc() - t_depth
+            self._prune_depth_cache(frame_count)
 
             # ── 3. Store shared state ────────────────────────
             with self._state_lock:
                 self._last_detections = detections
-                self._last_depth_map = (
-                    self.estimator._depth_map.copy()
-                    if self.estimator._depth_map is not None else None
-                )
+                # No copy: the estimator double-buffers its output
+                self._last_depth_map = self.estimator.depth_map
 
             # ── 4. Publish detections via MQTT ───────────────
-            payload = json.dumps(detections)
-            self.mqtt.publish("ai/objects", payload)
+            # QoS 0, not retained: fire-and-forget, stale frames are useless
+            payload = orjson.dumps(detections)   # bytes, no str→bytes step
+            self.mqtt.publish("ai/objects", payload, qos=0, retain=False)
 
-            dt_total = time.time() - t_start
+            dt_total = _pc() - t_start
             frame_count += 1
 
             # ── rolling average logging ──────────────────────
-            acc_yolo += dt_yolo
-            acc_depth += dt_depth
-            acc_total += dt_total
+            timings.append((dt_yolo, dt_depth, dt_total))
 
             if frame_count % LOG_INTERVAL == 0:
-                avg_yolo = acc_yolo / LOG_INTERVAL
-                avg_depth = acc_depth / LOG_INTERVAL
-                avg_total = acc_total / LOG_INTERVAL
+                # ns sums → mean seconds, converted only when printing
+                avg_yolo, avg_depth, avg_total = (
+                    sum(col) / (len(timings) * 1e9) for col in zip(*timings))
 
                 fps_yolo = 1.0 / avg_yolo if avg_yolo > 0 else float("inf")
                 fps_depth = 1.0 / avg_depth if avg_depth > 0 else float("inf")
@@ -271,7 +568,27 @@ class VisionPipeline:
                     f"ViTS {fps_depth:5.1f} fps ({avg_depth*1000:.0f} ms)  |  "
                     f"Total {fps_total:5.1f} fps ({avg_total*1000:.0f} ms)"
                 )
-                acc_yolo = acc_depth = acc_total = 0.0
+
+    def _use_cached_depth(self, det: dict, frame_idx: int) -> bool:
+        """Fill det["distance"] from the track's cached depth if the bbox is
+        (nearly) unchanged and the entry is fresh; return True on a hit."""
+        entry = self._depth_cache.get(det["id"])
+        if entry is None:
+            return False
+        bbox, distance, cached_idx = entry
+        if frame_idx - cached_idx >= _CACHE_MAX_AGE:
+            return False
+        if max(abs(a - b) for a, b in zip(det["bbox"], bbox)) >= _CACHE_MOVE_PX:
+            return False
+        det["distance"] = distance
+        return True
+
+    def _prune_depth_cache(self, frame_idx: int):
+        """Drop entries of tracks that have not been refreshed recently."""
+        expired = [tid for tid, (_, _, idx) in self._depth_cache.items()
+                   if frame_idx - idx >= _CACHE_MAX_AGE]
+        for tid in expired:
+            del self._depth_cache[tid]
 
     # ────────────────────────────────────────────────────────────
     #  Debug loop  (runs at _DEBUG_FPS, overlays persistent bboxes)
@@ -294,14 +611,11 @@ class VisionPipeline:
                 depth_map = self._last_depth_map
 
             # Annotate every frame with the *persistent* last-known bboxes
-            annotated = _annotate_frame(frame, detections)
+            annotated = cv2.resize(_annotate_frame(frame, detections),
+                                   _DEBUG_SIZE, interpolation=cv2.INTER_AREA)
             heatmap = _depth_to_heatmap(depth_map)
 
-            debug_payload = json.dumps({
-                "annotated": _encode_jpeg_b64(annotated),
-                "depth": _encode_jpeg_b64(heatmap),
-            })
-            self.mqtt.publish("ai/debug", debug_payload)
+            self._submit_publish(annotated, heatmap)
 
             frame_count += 1
 
@@ -310,3 +624,20 @@ class VisionPipeline:
             remaining = interval - elapsed
             if remaining > 0:
                 time.sleep(remaining)
+
+    def _submit_publish(self, annotated: np.ndarray, heatmap: np.ndarray):
+        """Queue an encode + publish job, dropping the oldest queued one
+        when MQTT or the encoder falls behind."""
+        pending = self._pending_publishes
+        while pending and pending[0].done():
+            pending.popleft()
+        if len(pending) >= _MAX_PENDING_PUBLISHES:
+            pending.popleft().cancel()   # no-op if already running
+        pending.append(self._publish_pool.submit(
+            self._encode_and_publish, annotated, heatmap))
+
+    def _encode_and_publish(self, annotated: np.ndarray, heatmap: np.ndarray):
+        self.mqtt.publish("ai/debug/annotated", _encode_jpeg(annotated),
+                          qos=0, retain=False)
+        self.mqtt.publish("ai/debug/depth", _encode_jpeg(heatmap),
+                          qos=0, retain=False)
@@ -8,6 +8,7 @@ Starts:
 """
 
 import argparse
+import os
 import threading
 import time
 import signal
@@ -15,6 +16,10 @@ import sys
 
 import paho.mqtt.client as mqtt
 
+# Project-wide config.py lives one level up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import get_cfg
 from depth.pipeline import VisionPipeline
 
 
@@ -28,10 +33,11 @@ def on_connect(client, userdata, flags, rc):
 
 
 def on_message(client, userdata, msg):
-    # Light logging – truncate long payloads
-    payload = msg.payload.decode("utf-8", errors="replace")
-    if len(payload) > 120:
-        payload = payload[:120] + "…"
+    # Light logging – truncate long payloads (slice before decoding, so
+    # debug JPEGs are never decoded in full)
+    payload = msg.payload[:120].decode("utf-8", errors="replace")
+    if len(msg.payload) > 120:
+        payload += "…"
     # print(f"[mqtt] {msg.topic}: {payload}")
 
 
@@ -42,6 +48,9 @@ def main():
                         help="Raspberry Pi IP address")
     parser.add_argument("--stream-port", type=int, default=5000,
                         help="Camera stream port on the RPi")
+    parser.add_argument("--shm", action="store_true",
+                        help="Read raw frames from shared memory (camera "
+                             "streamer on this host, started with --shm)")
     parser.add_argument("--mqtt-port", type=int, default=1883,
                         help="MQTT TCP port")
     parser.add_argument("--ws-port", type=int, default=9001,
@@ -50,9 +59,30 @@ def main():
                         help="Torch device for AI models (cpu / cuda:0)")
     parser.add_argument("--yolo-model", default="yolo11n.pt",
                         help="YOLO model file")
+    parser.add_argument("--imgsz", type=int, default=416,
+                        help="YOLO inference resolution")
+    parser.add_argument("--no-export", action="store_true",
+                        help="Run the YOLO .pt model directly instead of "
+                             "exporting it to TensorRT / OpenVINO")
+    parser.add_argument("--engine", default=None,
+                        help="Pre-built TensorRT .engine (or OpenVINO model "
+                             "dir) to load instead of --yolo-model")
+    parser.add_argument("--int8", action="store_true",
+                        help="Export YOLO with INT8 quantization")
+    parser.add_argument("--int8-data", default=None,
+                        help="Dataset YAML used for INT8 calibration")
     parser.add_argument("--depth-model",
                         default="depth-anything/Depth-Anything-V2-Small-hf",
                         help="HuggingFace depth model ID")
+    parser.add_argument("--depth-tiling", action="store_true",
+                        help="Run the depth ViT on overlapping native-"
+                             "resolution tiles instead of a resized frame")
+    parser.add_argument("--compile-depth", action="store_true",
+                        help="torch.compile the depth ViT on CPU too "
+                             "(always compiled on GPU)")
+    parser.add_argument("--depth-int8", action="store_true",
+                        help="Dynamically quantise the depth ViT to int8 "
+                             "(CPU only)")
     args = parser.parse_args()
 
     # ── 1. Connect MQTT client (retry until broker is reachable) ──
@@ -71,13 +101,23 @@ def main():
     mqtt_client.loop_start()
 
     # ── 2. Start vision pipeline ─────────────────────────────────
-    stream_url = f"http://{args.rpi_ip}:{args.stream_port}/video"
+    if args.shm:
+        stream_url = f"shm://{get_cfg().FRAME_SHM_NAME}"
+    else:
+        stream_url = f"http://{args.rpi_ip}:{args.stream_port}/video"
     pipeline = VisionPipeline(
         stream_url=stream_url,
         mqtt_client=mqtt_client,
-        yolo_model=args.yolo_model,
+        yolo_model=args.engine or args.yolo_model,
         depth_model=args.depth_model,
         device=args.device,
+        yolo_imgsz=args.imgsz,
+        export_yolo=not args.no_export,
+        yolo_int8=args.int8,
+        yolo_int8_data=args.int8_data,
+        depth_tiling=args.depth_tiling,
+        compile_depth_cpu=args.compile_depth,
+        depth_int8_cpu=args.depth_int8,
     )
 
     pipeline_thread = threading.Thread(target=pipeline.start, daemon=True)
@@ -4,8 +4,7 @@ MQTT Broker helper – generates a Mosquitto configuration and
 provides utilities to manage the broker.
 
 Topics handled by the system:
-  mouse/speed     – car speed from RPi mouse tracker
-  mouse/steering  – steering angle from RPi mouse tracker
+  mouse/control   – car speed + steering angle from RPi mouse tracker
   mouse/obstacle  – obstacle event (wheel click)
   ai/objects      – detected objects from the depth pipeline
 """
@@ -21,6 +20,8 @@ MOSQUITTO_CONF_TEMPLATE = """\
 # TCP listener (for Python / device clients)
 listener {mqtt_port}
 protocol mqtt
+# MQTT v5 topic aliases the device may register (one per topic it sends)
+max_topic_alias 10
 
 # WebSocket listener (for the browser frontend)
 listener {ws_port}
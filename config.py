@@ -3,21 +3,25 @@
 Shared configuration – reads conf.conf and exposes project‑wide defaults.
 
 Usage:
-    from config import cfg
+    from config import get_cfg
+    cfg = get_cfg()
     print(cfg.SERVER_IP)
+
+conf.conf is read on the first get_cfg() call, not at import time
+(``from config import cfg`` still works and is equally lazy).
 """
 
+import functools
 import os
-import pathlib
 
 
-_ROOT = pathlib.Path(__file__).resolve().parent
+_ROOT = os.path.dirname(os.path.abspath(__file__))
 
 
-def _load_conf(path: pathlib.Path) -> dict[str, str]:
+def _load_conf(path: str) -> dict[str, str]:
     """Parse a simple KEY=VALUE config file."""
     data: dict[str, str] = {}
-    if not path.exists():
+    if not os.path.exists(path):
         return data
     with open(path) as f:
         for line in f:
@@ -34,7 +38,7 @@ class Config:
     """Immutable project configuration."""
 
     def __init__(self):
-        raw = _load_conf(_ROOT / "conf.conf")
+        raw = _load_conf(os.path.join(_ROOT, "conf.conf"))
 
         # Network
         self.SERVER_IP: str = raw.get("SERVER_IP", "localhost")
@@ -45,9 +49,11 @@ class Config:
         self.MQTT_WS_PORT: int = 9001
         self.CAMERA_STREAM_PORT: int = 5000
 
+        # Raw-frame shared memory (device --shm / backend --shm)
+        self.FRAME_SHM_NAME: str = "realtime_car_frame"
+
         # MQTT topics
-        self.TOPIC_SPEED: str = "mouse/speed"
-        self.TOPIC_STEERING: str = "mouse/steering"
+        self.TOPIC_CONTROL: str = "mouse/control"   # {"speed", "angle"}
         self.TOPIC_OBSTACLE: str = "mouse/obstacle"
         self.TOPIC_OBJECTS: str = "ai/objects"
 
@@ -64,4 +70,14 @@ class Config:
                 f"MQTT={self.MQTT_PORT}, CAM={self.CAMERA_STREAM_PORT})")
 
 
-cfg = Config()
+@functools.lru_cache(maxsize=1)
+def get_cfg() -> Config:
+    """The project configuration, loaded once on first use."""
+    return Config()
+
+
+def __getattr__(name: str):
+    # Lazy module attribute: keeps ``from config import cfg`` working
+    if name == "cfg":
+        return get_cfg()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -7,33 +7,170 @@ Supports two sources that can be switched at runtime via HTTP:
   GET /source         → JSON with the active source info
   POST /source/camera → switch to live camera
   POST /source/file?path=video/drive.mp4 → switch to a video file (loops)
+
+When the backend runs on the same host, raw BGR frames can additionally be
+published to shared memory (``--shm``) so it can skip the JPEG round trip.
 """
 
 import os
 import time
 import json
+import socket
+import struct
 import threading
 import urllib.parse
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from socketserver import ThreadingMixIn
-from typing import Optional
+from typing import Optional, Tuple
 
 import cv2
 
+try:
+    from multiprocessing import shared_memory    # Python 3.8+
+except ImportError:
+    shared_memory = None
+
+try:
+    from picamera2 import Picamera2    # libcamera stack (Raspberry Pi OS)
+except ImportError:
+    Picamera2 = None
+
 # ── defaults ─────────────────────────────────────────────────────
 
 STREAM_FPS = 30
 JPEG_QUALITY = 70
+PICAMERA_SIZE = (640, 480)   # (w, h) of the Pi camera video stream
 VIDEO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "video")
+RING_SLOTS = 3    # encoded frames kept alive for lock-free readers
+
+# Multipart boundary + part headers, %-formatted with the JPEG length
+_PART_HEADER = (b"--frame\r\nContent-Type: image/jpeg\r\n"
+                b"Content-Length: %d\r\n\r\n")
+
+# Raw-frame shared memory (same layout as backend/depth/pipeline.py):
+# header (seq, height, width) followed by height*width*3 BGR bytes.
+# seq is odd while a frame is being written (seqlock).
+SHM_HEADER = struct.Struct("<QII")
+SHM_MAX_BYTES = 1920 * 1080 * 3
+
+# OpenCV wheels normally bundle SIMD libjpeg-turbo; if this build does not,
+# encode with PyTurboJPEG instead (when installed)
+_turbo = None
+if "libjpeg-turbo" not in cv2.getBuildInformation():
+    try:
+        from turbojpeg import TurboJPEG, TJSAMP_420
+        _turbo = TurboJPEG()
+    except (ImportError, OSError):    # module or libturbojpeg.so missing
+        pass
+
+
+def _encode_jpeg(frame) -> memoryview:
+    """JPEG-encode a BGR frame at JPEG_QUALITY."""
+    if _turbo is not None:
+        return memoryview(_turbo.encode(frame, quality=JPEG_QUALITY,
+                                        jpeg_subsample=TJSAMP_420))
+    _, jpeg = cv2.imencode(
+        ".jpg", frame,
+        [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY],
+    )
+    return memoryview(jpeg.reshape(-1))
+
+
+class _ShmFrameWriter:
+    """Publishes the latest raw BGR frame to a named shared-memory block."""
+
+    def __init__(self, name: str):
+        size = SHM_HEADER.size + SHM_MAX_BYTES
+        try:
+            self._shm = shared_memory.SharedMemory(name=name, create=True,
+                                                   size=size)
+        except FileExistsError:     # left over from a previous run
+            self._shm = shared_memory.SharedMemory(name=name)
+            if self._shm.size != size:      # older/other layout: recreate
+                self._shm.close()
+                self._shm.unlink()
+                self._shm = shared_memory.SharedMemory(name=name, create=True,
+                                                       size=size)
+        self._seq = 0
+        SHM_HEADER.pack_into(self._shm.buf, 0, 0, 0, 0)
+
+    def write(self, frame):
+        h, w = frame.shape[:2]
+        n = h * w * 3
+        if n > SHM_MAX_BYTES:
+            return
+        buf = self._shm.buf
+        SHM_HEADER.pack_into(buf, 0, self._seq + 1, h, w)      # writing
+        buf[SHM_HEADER.size:SHM_HEADER.size + n] = frame.reshape(-1)
+        self._seq += 2
+        SHM_HEADER.pack_into(buf, 0, self._seq, h, w)          # stable
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+class _Picamera2Capture:
+    """Minimal cv2.VideoCapture look-alike over a Picamera2 (CSI camera)
+    video stream, so the capture loop can treat both sources the same.
+
+    "RGB888" in libcamera is B,G,R byte order, i.e. what OpenCV expects;
+    capture_array() blocks until the ISP delivers the next frame."""
+
+    def __init__(self, size=PICAMERA_SIZE):
+        self._cam = Picamera2()
+        self._cam.configure(self._cam.create_video_configuration(
+            main={"size": size, "format": "RGB888"}, buffer_count=2))
+        self._cam.start()
+
+    def isOpened(self) -> bool:
+        return self._cam is not None
+
+    def read(self):
+        # Like VideoCapture.read(): (False, None) once released – a source
+        # switch may release() from an HTTP thread while the capture loop
+        # is blocked in capture_array()
+        cam = self._cam
+        if cam is None:
+            return False, None
+        try:
+            return True, cam.capture_array("main")
+        except Exception:       # camera stopped/closed under us
+            return False, None
+
+    def release(self):
+        cam, self._cam = self._cam, None
+        if cam is not None:
+            try:
+                cam.stop()
+                cam.close()
+            except Exception as e:
+                print(f"[camera_stream] Picamera2 release failed: {e}")
 
 
 class CameraCapture:
     """Grabs JPEG frames from a camera or a video file.
     The source can be changed at runtime with switch_*() methods."""
 
-    def __init__(self, camera_index: int = 0, default_file: Optional[str] = None):
+    def __init__(self, camera_index: int = 0, default_file: Optional[str] = None,
+                 shm: Optional[str] = None, picamera: bool = False):
         self._lock = threading.Lock()
-        self._frame: bytes = b""
+        self._picamera = picamera and Picamera2 is not None
+        if picamera and not self._picamera:
+            print("[camera_stream] picamera2 not installed, using V4L2")
+        self._shm: Optional[_ShmFrameWriter] = None
+        if shm and shared_memory is None:
+            print("[camera_stream] Shared memory needs Python 3.8+, disabled")
+        elif shm:
+            self._shm = _ShmFrameWriter(shm)
+            print(f"[camera_stream] Raw frames in shared memory: {shm}")
+        # Lock-free frame handoff: the capture thread writes slot seq % N,
+        # then publishes seq; readers take slot (seq - 1) % N.  Every slot
+        # holds a fresh imencode() buffer that is never mutated in place.
+        self._slots: list = [None] * RING_SLOTS
+        self._seq = 0
+        # Wakes stream handlers when a new frame is published
+        self._new_frame = threading.Condition()
         self._camera_index = camera_index
         self._target_fps = STREAM_FPS
 
@@ -42,6 +179,7 @@ class CameraCapture:
         self._source_detail = str(camera_index)
         self._cap: Optional[cv2.VideoCapture] = None
         self._is_file = False
+        self._file_path: Optional[str] = None
 
         # Start with a video file if provided and it exists
         if default_file and os.path.isfile(default_file):
@@ -80,13 +218,34 @@ class CameraCapture:
 
     # ── internal helpers ─────────────────────────────────────────
     def _open_camera(self, index: int):
-        self._cap = cv2.VideoCapture(index)
         self._is_file = False
         self._target_fps = STREAM_FPS
+        if self._picamera:
+            self._cap = _Picamera2Capture()
+            return
+        self._cap = cv2.VideoCapture(index, cv2.CAP_V4L2)
+        # Ask the camera for MJPEG and hand back the compressed buffer as-is
+        # (CONVERT_RGB=0), so frames are forwarded without decode/re-encode.
+        # Shared memory carries raw BGR, so keep decoding in that case.
+        # FOURCC is only a request: read it back, since a camera that stays
+        # YUYV/NV12 would hand out raw planar buffers with CONVERT_RGB=0.
+        mjpg = cv2.VideoWriter_fourcc(*"MJPG")
+        self._cap.set(cv2.CAP_PROP_FOURCC, mjpg)
+        if (self._shm is None
+                and int(self._cap.get(cv2.CAP_PROP_FOURCC)) == mjpg):
+            self._cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    @staticmethod
+    def _file_capture(filepath: str) -> cv2.VideoCapture:
+        cap = cv2.VideoCapture(filepath)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
 
     def _open_file(self, filepath: str):
-        self._cap = cv2.VideoCapture(filepath)
+        self._cap = self._file_capture(filepath)
         self._is_file = True
+        self._file_path = filepath
         # Use the video's native FPS for correct playback speed
         native_fps = self._cap.get(cv2.CAP_PROP_FPS)
         if native_fps > 0:
@@ -117,22 +276,35 @@ class CameraCapture:
 
             ret, frame = cap.read()
 
-            # loop video files
+            # loop video files: reopening is cheaper and cleaner than
+            # seeking to frame 0, which makes FFmpeg decode from the start
             if not ret and is_file:
                 with self._lock:
                     if self._cap is cap:          # still same source
-                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        cap.release()
+                        self._cap = self._file_capture(self._file_path)
                 continue
             if not ret:
                 time.sleep(0.01)
                 continue
 
-            _, jpeg = cv2.imencode(
-                ".jpg", frame,
-                [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY],
-            )
-            with self._lock:
-                self._frame = jpeg.tobytes()
+            if frame.ndim == 3:
+                if self._shm is not None:
+                    self._shm.write(frame)
+                jpeg = _encode_jpeg(frame)
+            else:
+                # raw MJPEG buffer straight from the camera
+                jpeg = memoryview(frame.reshape(-1))
+            seq = self._seq
+            self._slots[seq % RING_SLOTS] = jpeg
+            self._seq = seq + 1
+            with self._new_frame:
+                self._new_frame.notify_all()
+
+            # Cameras are paced by the driver (read() blocks until the next
+            # frame); only file playback needs sleeping to native FPS
+            if not is_file:
+                continue
 
             # Sleep only the REMAINING time to hit target FPS
             elapsed = time.monotonic() - t0
@@ -141,19 +313,49 @@ class CameraCapture:
             if remaining > 0:
                 time.sleep(remaining)
 
-    def get_frame(self) -> bytes:
-        with self._lock:
-            return self._frame
+    def get_frame(self) -> Tuple[int, Optional[memoryview]]:
+        """Return (seq, jpeg) for the latest encoded frame without locking.
+        seq is 0 and jpeg is None until the first frame is captured."""
+        while True:
+            seq = self._seq
+            if seq == 0:
+                return 0, None
+            frame = self._slots[(seq - 1) % RING_SLOTS]
+            # seqlock re-check: retry if the writer lapped the whole ring
+            if self._seq - seq < RING_SLOTS - 1:
+                return seq, frame
+
+    def wait_frame(self, last_seq: int, timeout: float = 1.0
+                   ) -> Tuple[int, Optional[memoryview]]:
+        """Block until a frame newer than *last_seq* is published (or
+        *timeout* expires), then return get_frame()."""
+        with self._new_frame:
+            self._new_frame.wait_for(lambda: self._seq != last_seq, timeout)
+        return self.get_frame()
 
     def stop(self):
         self._running = False
         self._release_cap()
+        if self._shm is not None:
+            self._shm.close()
 
 
 # ── HTTP handler ─────────────────────────────────────────────────
 _camera: Optional[CameraCapture] = None
 
 
+def _sendmsg_all(sock: socket.socket, buffers: list):
+    """Scatter-gather send of *buffers* in as few syscalls as possible,
+    resuming after partial sends."""
+    views = [memoryview(b) for b in buffers]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views.pop(0))
+        if views:
+            views[0] = views[0][sent:]
+
+
 class StreamHandler(BaseHTTPRequestHandler):
     """
     Routes:
@@ -163,6 +365,9 @@ class StreamHandler(BaseHTTPRequestHandler):
       POST /source/file?path=<relative_path>  → switch to video file
     """
 
+    # TCP_NODELAY: each multipart frame leaves as soon as it is written
+    disable_nagle_algorithm = True
+
     def do_GET(self):
         if self.path == "/video":
             self._serve_mjpeg()
@@ -199,19 +404,17 @@ class StreamHandler(BaseHTTPRequestHandler):
                          "multipart/x-mixed-replace; boundary=frame")
         self.send_header("Access-Control-Allow-Origin", "*")
         self.end_headers()
+        last_seq = 0
         try:
             while True:
-                frame = _camera.get_frame()
-                if not frame:
-                    time.sleep(0.05)
+                # Paced by the capture thread: wake up once per new frame
+                seq, frame = _camera.wait_frame(last_seq)
+                if frame is None or seq == last_seq:
                     continue
-                self.wfile.write(b"--frame\r\n")
-                self.wfile.write(b"Content-Type: image/jpeg\r\n")
-                self.wfile.write(("Content-Length: %d\r\n" % len(frame)).encode())
-                self.wfile.write(b"\r\n")
-                self.wfile.write(frame)
-                self.wfile.write(b"\r\n")
-                time.sleep(1.0 / STREAM_FPS)
+                last_seq = seq
+                # Boundary + headers + JPEG + CRLF in one sendmsg() call
+                _sendmsg_all(self.connection,
+                             [_PART_HEADER % len(frame), frame, b"\r\n"])
         except (BrokenPipeError, ConnectionResetError):
             pass
 
@@ -234,11 +437,16 @@ class _ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     daemon_threads = True
 
 
-def start_camera_stream(host: str = "0.0.0.0", port: int = 5000):
-    """Start the HTTP server (blocking)."""
+def start_camera_stream(host: str = "0.0.0.0", port: int = 5000,
+                        shm: Optional[str] = None, picamera: bool = False):
+    """Start the HTTP server (blocking).  *shm* names a shared-memory block
+    to also publish raw frames to, for a backend on the same host (None:
+    HTTP only); *picamera* reads the
+    CSI camera through picamera2 instead of V4L2."""
     global _camera
     default_video = os.path.join(VIDEO_DIR, "drive.mp4")
-    _camera = CameraCapture(default_file=default_video)
+    _camera = CameraCapture(default_file=default_video, shm=shm,
+                            picamera=picamera)
     server = _ThreadedHTTPServer((host, port), StreamHandler)
     print(f"[camera_stream] Streaming on http://{host}:{port}/video")
     print("[camera_stream] Switch source via POST /source/camera or /source/file?path=...")
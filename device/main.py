@@ -8,17 +8,61 @@ Starts both:
 """
 
 import argparse
+import os
+import socket
+import sys
 import threading
 import time
 import paho.mqtt.client as mqtt
 
+# Project-wide config.py lives one level up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import get_cfg
 from mouse_tracker import MouseTracker
 from camera_stream import start_camera_stream
 
 
-def on_connect(client, userdata, flags, rc):
+def on_connect(client, userdata, flags, rc, properties=None):
     status = "OK" if rc == 0 else f"FAILED (code {rc})"
     print(f"[device] MQTT connection: {status}")
+    # Control payloads are ~40 bytes: send each at once instead of letting
+    # Nagle hold it back while an earlier segment is unacknowledged
+    sock = client.socket()
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def on_disconnect(client, userdata, rc, properties=None):
+    # Topic aliases only live as long as the connection: make the publisher
+    # attached by MouseTracker send the full topic name again.  Reset here,
+    # not on CONNACK – reconnect() sends CONNECT before the CONNACK arrives,
+    # and a publish in between must not go out as alias-only.
+    if userdata is not None:
+        userdata.reset()
+
+
+def connect_client(client_id: str, broker: str, port: int) -> mqtt.Client:
+    """Connect a new MQTT client (retrying until the broker is reachable)
+    and start its network thread."""
+    # MQTT v5 for topic aliases (see mouse_tracker._AliasPublisher)
+    client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5)
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    # Bounded backoff for paho's automatic reconnects (all publishes are
+    # QoS 0, so the inflight/queue windows don't apply)
+    client.reconnect_delay_set(min_delay=1, max_delay=8)
+
+    while True:
+        try:
+            client.connect(broker, port, keepalive=60)
+            break
+        except (ConnectionRefusedError, OSError) as e:
+            print(f"[device] MQTT broker not reachable ({e}) – retrying in 3 s…")
+            time.sleep(3)
+
+    client.loop_start()
+    return client
 
 
 def main():
@@ -29,31 +73,34 @@ def main():
                         help="MQTT broker port")
     parser.add_argument("--stream-port", type=int, default=5000,
                         help="HTTP camera stream port")
+    parser.add_argument("--shm", action="store_true",
+                        help="Also publish raw frames via shared memory "
+                             "(backend on the same host)")
+    parser.add_argument("--picamera", action="store_true",
+                        help="Use the CSI camera via picamera2 instead of "
+                             "a V4L2/USB camera")
     args = parser.parse_args()
 
-    # ── MQTT client (retry until broker is reachable) ─────────────
-    mqtt_client = mqtt.Client(client_id="rpi_device")
-    mqtt_client.on_connect = on_connect
-
-    while True:
-        try:
-            mqtt_client.connect(args.broker, args.mqtt_port, keepalive=60)
-            break
-        except (ConnectionRefusedError, OSError) as e:
-            print(f"[device] MQTT broker not reachable ({e}) – retrying in 3 s…")
-            time.sleep(3)
-
-    mqtt_client.loop_start()
+    # ── MQTT clients: one socket + network thread per topic ───────
+    # MQTT serialises everything sent on a connection, so an obstacle
+    # burst never queues behind control updates (or vice versa)
+    clients = {
+        topic: connect_client(f"rpi_device_{topic}",
+                              args.broker, args.mqtt_port)
+        for topic in ("control", "obstacle")
+    }
 
     # ── Mouse tracker ─────────────────────────────────────────────
-    tracker = MouseTracker(mqtt_client)
+    tracker = MouseTracker(clients)
     tracker.start()
     print("[device] Mouse tracker started")
 
     # ── Camera stream (blocking – runs in its own thread) ─────────
     cam_thread = threading.Thread(
         target=start_camera_stream,
-        kwargs={"host": "0.0.0.0", "port": args.stream_port},
+        kwargs={"host": "0.0.0.0", "port": args.stream_port,
+                "shm": get_cfg().FRAME_SHM_NAME if args.shm else None,
+                "picamera": args.picamera},
         daemon=True,
     )
     cam_thread.start()
@@ -66,8 +113,9 @@ def main():
     except KeyboardInterrupt:
         print("\n[device] Shutting down…")
         tracker.stop()
-        mqtt_client.loop_stop()
-        mqtt_client.disconnect()
+        for client in clients.values():
+            client.loop_stop()
+            client.disconnect()
 
 
 if __name__ == "__main__":
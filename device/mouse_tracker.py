@@ -13,13 +13,25 @@ Controls:
   - Mouse X movement: steering (proportional to displacement from origin)
 """
 
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import selectors
 import time
-import json
 import threading
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
 import evdev
 from evdev import InputDevice, categorize, ecodes
 
+try:
+    from numba import njit
+except ImportError:     # optional – _tick stays plain Python
+    njit = None
+
 # ── Physics constants ────────────────────────────────────────────────
 MAX_SPEED = 200.0        # km/h (arbitrary game units)
 ACCEL_RATE = 40.0        # units/s when accelerating
@@ -33,6 +45,98 @@ SPEED_PUBLISH_THRESHOLD = 0.01  # publish when speed changes > 1 %
 STEERING_PUBLISH_THRESHOLD = 0.5  # degrees dead-zone for publish
 
 PHYSICS_HZ = 60  # physics update rate
+CONTROL_PUBLISH_HZ = 30  # max mouse/control publish rate
+# Minimum gap between control publishes, with half a physics tick of
+# tolerance: tick jitter must not push every other publish a tick later
+_CONTROL_MIN_INTERVAL = 1.0 / CONTROL_PUBLISH_HZ - 0.5 / PHYSICS_HZ
+OBSTACLE_MIN_INTERVAL = 0.05  # s; faster wheel ticks are dropped
+PHYSICS_RT_PRIORITY = 10  # SCHED_FIFO priority of the physics thread
+
+TOPIC_CONTROL = "mouse/control"
+TOPIC_OBSTACLE = "mouse/obstacle"
+
+# Pre-built JSON payload templates (bytes %-formatting, no json.dumps)
+_CONTROL_FMT = b'{"speed":%.2f,"angle":%.2f}'
+_OBSTACLE_FMT = b'{"event":"wheel_click","timestamp":%.3f}'
+
+# Diagnostics go through a queue while a tracker runs: the evdev / physics
+# threads only enqueue, a QueueListener thread does the console I/O
+log = logging.getLogger("mouse_tracker")
+_log_queue = queue.SimpleQueue()
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_console = logging.StreamHandler()
+_console.setFormatter(logging.Formatter("[mouse_tracker] %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _console)
+
+
+def _start_logging():
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    log.addHandler(_queue_handler)
+    _log_listener.start()
+    atexit.register(_stop_logging)      # flush queued records on exit
+
+
+def _stop_logging():
+    atexit.unregister(_stop_logging)
+    _log_listener.stop()                # drains the queue, joins the thread
+    log.removeHandler(_queue_handler)
+    log.propagate = True
+
+
+def _accel_per_tick(left, right):
+    """Signed speed change per physics tick for a button state."""
+    if left:
+        rate = ACCEL_RATE                 # accelerating
+    elif right:
+        rate = -BRAKE_RATE                # braking
+    else:
+        rate = -ENGINE_BRAKE_RATE         # engine brake
+    return rate / PHYSICS_HZ
+
+
+def _tick(speed, x_disp, accel):
+    """One physics step: returns the new (speed, steering_angle)."""
+    speed = max(0.0, min(MAX_SPEED, speed + accel))
+
+    angle = max(-MAX_STEERING_ANGLE,
+                min(MAX_STEERING_ANGLE, x_disp * STEERING_SENSITIVITY))
+    return speed, angle
+
+
+if njit is not None:
+    _tick = njit(cache=True)(_tick)
+
+
+class _AliasPublisher:
+    """
+    Publishes on one topic of an MQTT v5 client through a topic alias:
+    the first message of each connection carries the topic name and
+    registers the alias, later ones an empty topic plus the 2-byte alias.
+    Installs itself as the client's userdata; on_disconnect must call
+    reset() since aliases do not survive a reconnect.
+    """
+
+    __slots__ = ("_publish", "_topic", "_props", "_sent")
+
+    def __init__(self, client: mqtt.Client, topic: str, alias: int = 1):
+        self._publish = client.publish      # bound once, not per call
+        self._topic = topic
+        self._props = Properties(PacketTypes.PUBLISH)
+        self._props.TopicAlias = alias
+        self._sent = False
+        client.user_data_set(self)
+
+    def reset(self):
+        self._sent = False
+
+    def __call__(self, payload: bytes):
+        if self._sent:
+            self._publish("", payload, properties=self._props)
+        else:
+            # Only a message that reached the socket registers the alias
+            info = self._publish(self._topic, payload, properties=self._props)
+            self._sent = info.rc == mqtt.MQTT_ERR_SUCCESS
 
 
 def find_mouse_device():
@@ -42,7 +146,7 @@ def find_mouse_device():
         caps = dev.capabilities(verbose=False)
         # A mouse has REL axes (EV_REL = 2) and keys/buttons (EV_KEY = 1)
         if ecodes.EV_REL in caps and ecodes.EV_KEY in caps:
-            print(f"[mouse_tracker] Found mouse: {dev.name} ({dev.path})")
+            log.info("Found mouse: %s (%s)", dev.name, dev.path)
             return dev
     return None
 
@@ -50,33 +154,64 @@ def find_mouse_device():
 class MouseTracker:
     """Reads mouse events via evdev and maintains car speed / steering state."""
 
-    def __init__(self, mqtt_client: mqtt.Client, device_path: str = None):
-        self.mqtt = mqtt_client
+    # Fixed attribute set: slot descriptors instead of a per-instance dict
+    # for the state the physics loop reads and writes every tick
+    __slots__ = (
+        "mqtt", "_publish_control", "_publish_obstacle_msg", "_device_path",
+        "speed", "steering_angle", "_inputs",
+        "_last_pub_speed", "_last_pub_steering", "_speed_threshold",
+        "_last_pub_time", "_last_obstacle",
+        "_running",
+    )
+
+    def __init__(self, mqtt_clients: "dict[str, mqtt.Client]",
+                 device_path: str = None):
+        # {"control": client, "obstacle": client}, one MQTT v5 client each
+        self.mqtt = mqtt_clients
+        self._publish_control = _AliasPublisher(
+            mqtt_clients["control"], TOPIC_CONTROL)
+        self._publish_obstacle_msg = _AliasPublisher(
+            mqtt_clients["obstacle"], TOPIC_OBSTACLE)
         self._device_path = device_path
 
         # ── state ─────────────────────────────────────────────────
         self.speed = 0.0          # current speed [0 .. MAX_SPEED]
         self.steering_angle = 0.0 # current steering [-MAX .. +MAX]
-        self.x_displacement = 0.0 # accumulated X displacement from origin
 
-        self.left_pressed = False
-        self.right_pressed = False
+        # Input snapshot (x_displacement, accel_per_tick): written only by
+        # the evdev thread as one tuple, so the physics thread always reads
+        # a consistent pair with a single load.  The acceleration is
+        # resolved from the buttons when they change, not every tick.
+        self._inputs = (0.0, _accel_per_tick(False, False))
 
         # last-published values (for threshold comparison)
         self._last_pub_speed = -1.0
         self._last_pub_steering = -999.0
+        self._speed_threshold = 0.5        # absolute threshold near zero
+        self._last_pub_time = float("-inf")  # monotonic, last control publish
+        self._last_obstacle = float("-inf")  # monotonic time of last obstacle
 
         self._running = False
 
     # ── public API ────────────────────────────────────────────────
     def start(self):
         """Start evdev reader + physics thread."""
+        if self._running:
+            return
         self._running = True
+        _start_logging()
+        if njit is not None:
+            # Trigger (or load the cached) JIT compilation here, not on the
+            # first tick after the physics thread went SCHED_FIFO
+            _tick(0.0, 0.0, 0.0)
         threading.Thread(target=self._read_mouse, daemon=True).start()
         threading.Thread(target=self._physics_loop, daemon=True).start()
 
     def stop(self):
+        if not self._running:
+            return
         self._running = False
+        _stop_logging()
 
     # ── evdev event loop ─────────────────────────────────────────
     def _read_mouse(self):
@@ -84,96 +219,135 @@ class MouseTracker:
         try:
             if self._device_path:
                 dev = InputDevice(self._device_path)
-                print(f"[mouse_tracker] Using device: {dev.name} ({dev.path})")
+                log.info("Using device: %s (%s)", dev.name, dev.path)
             else:
                 dev = find_mouse_device()
                 if dev is None:
-                    print("[mouse_tracker] No mouse device found – "
-                          "running without mouse (use test_mqtt.py to simulate).")
+                    log.warning("No mouse device found – running without "
+                                "mouse (use test_mqtt.py to simulate).")
                     return
 
             # Grab the device so events don't leak to other consumers
             dev.grab()
 
-            for event in dev.read_loop():
-                if not self._running:
-                    break
-
-                # ── relative movement (EV_REL) ────────────────────
-                if event.type == ecodes.EV_REL:
-                    if event.code == ecodes.REL_X:
-                        self.x_displacement += event.value
-                    elif event.code == ecodes.REL_WHEEL:
-                        # scroll wheel → obstacle
-                        self._publish_obstacle()
-
-                # ── button press / release (EV_KEY) ───────────────
-                elif event.type == ecodes.EV_KEY:
-                    # value: 1 = pressed, 0 = released
-                    if event.code == ecodes.BTN_LEFT:
-                        self.left_pressed = (event.value == 1)
-                    elif event.code == ecodes.BTN_RIGHT:
-                        self.right_pressed = (event.value == 1)
-                    elif event.code == ecodes.BTN_MIDDLE and event.value == 1:
-                        self._publish_obstacle()
-
+            # Wait for the fd to become readable (epoll on Linux), then
+            # drain every queued event in one read(); REL_X deltas of a batch
+            # are summed and applied once.  The timeout lets stop() end the
+            # loop.
+            sel = selectors.DefaultSelector()
+            sel.register(dev.fd, selectors.EVENT_READ)
+            x_disp = self._inputs[0]
+            left = right = False
+            while self._running:
+                if not sel.select(timeout=0.5):
+                    continue
+
+                dx = 0
+                buttons = left, right
+                try:
+                    events = dev.read()
+                    for event in events:
+                        # ── relative movement (EV_REL) ────────────
+                        if event.type == ecodes.EV_REL:
+                            if event.code == ecodes.REL_X:
+                                dx += event.value
+                            elif event.code == ecodes.REL_WHEEL:
+                                # scroll wheel → obstacle
+                                self._publish_obstacle()
+
+                        # ── button press / release (EV_KEY) ───────
+                        elif event.type == ecodes.EV_KEY:
+                            # value: 1 = pressed, 0 = released
+                            if event.code == ecodes.BTN_LEFT:
+                                left = (event.value == 1)
+                            elif event.code == ecodes.BTN_RIGHT:
+                                right = (event.value == 1)
+                            elif event.code == ecodes.BTN_MIDDLE and event.value == 1:
+                                self._publish_obstacle()
+                except BlockingIOError:     # spurious wake-up
+                    pass
+                if buttons != (left, right):
+                    x_disp += dx
+                    self._inputs = (float(x_disp), _accel_per_tick(left, right))
+                elif dx:
+                    x_disp += dx
+                    self._inputs = (float(x_disp), self._inputs[1])
+
+            sel.close()
             dev.ungrab()
 
         except PermissionError:
-            print("[mouse_tracker] Permission denied – run with sudo "
-                  "or add user to the 'input' group.")
+            log.error("Permission denied – run with sudo "
+                      "or add user to the 'input' group.")
         except FileNotFoundError as e:
-            print(f"[mouse_tracker] Device not found: {e}")
+            log.error("Device not found: %s", e)
 
     # ── physics loop ─────────────────────────────────────────────
     def _physics_loop(self):
         dt = 1.0 / PHYSICS_HZ
+        # Real-time priority for this thread if allowed (root / CAP_SYS_NICE)
+        try:
+            os.sched_setscheduler(
+                0, os.SCHED_FIFO, os.sched_param(PHYSICS_RT_PRIORITY))
+        except (AttributeError, OSError):
+            pass
+
+        # Fixed-rate schedule on absolute monotonic deadlines: the sleep
+        # absorbs the work time, so ticks do not drift
+        next_t = time.monotonic()
+        inputs, settled = None, False
         while self._running:
-            # ── speed update ──────────────────────────────────────
-            if self.left_pressed:
-                # accelerating
-                self.speed += ACCEL_RATE * dt
-            elif self.right_pressed:
-                # braking
-                self.speed -= BRAKE_RATE * dt
-            else:
-                # engine brake
-                self.speed -= ENGINE_BRAKE_RATE * dt
-
-            self.speed = max(0.0, min(MAX_SPEED, self.speed))
-
-            # ── steering update ───────────────────────────────────
-            self.steering_angle = max(
-                -MAX_STEERING_ANGLE,
-                min(MAX_STEERING_ANGLE,
-                    self.x_displacement * STEERING_SENSITIVITY)
-            )
-
-            # ── publish if changed significantly ──────────────────
-            self._maybe_publish_speed()
-            self._maybe_publish_steering()
-
-            time.sleep(dt)
+            # Idle fast path: stopped, not accelerating, no new input and
+            # nothing left to publish – the tick would change nothing
+            if not (settled and self._inputs is inputs and self.speed == 0.0):
+                inputs = self._inputs
+                x_disp, accel = inputs
+                # ── speed + steering update ───────────────────────
+                self.speed, self.steering_angle = _tick(
+                    self.speed, x_disp, accel)
+
+                # ── publish if changed significantly ──────────────
+                settled = self._maybe_publish_control() and accel <= 0.0
+
+            next_t += dt
+            now = time.monotonic()
+            if next_t > now:
+                time.sleep(next_t - now)
+            elif now - next_t > dt:
+                next_t = now    # fell more than a tick behind: resync
 
     # ── MQTT publishers ──────────────────────────────────────────
-    def _maybe_publish_speed(self):
-        if self._last_pub_speed <= 0:
-            threshold = 0.5  # absolute threshold when near zero
-        else:
-            threshold = self._last_pub_speed * SPEED_PUBLISH_THRESHOLD
-
-        if abs(self.speed - self._last_pub_speed) >= threshold:
-            payload = json.dumps({"speed": round(self.speed, 2)})
-            self.mqtt.publish("mouse/speed", payload)
-            self._last_pub_speed = self.speed
-
-    def _maybe_publish_steering(self):
-        if abs(self.steering_angle - self._last_pub_steering) >= STEERING_PUBLISH_THRESHOLD:
-            payload = json.dumps({"angle": round(self.steering_angle, 2)})
-            self.mqtt.publish("mouse/steering", payload)
-            self._last_pub_steering = self.steering_angle
+    def _maybe_publish_control(self):
+        """Publish speed + steering together on mouse/control when either
+        crosses its threshold, at most CONTROL_PUBLISH_HZ times a second.
+        Returns True when both are within their dead zones (nothing to
+        publish)."""
+        speed = self.speed
+        angle = self.steering_angle
+        # Fast path (steady state): both changes inside their dead zones
+        t = self._speed_threshold
+        if (-t < speed - self._last_pub_speed < t and
+                -STEERING_PUBLISH_THRESHOLD < angle - self._last_pub_steering
+                < STEERING_PUBLISH_THRESHOLD):
+            return True
+
+        now = time.monotonic()
+        if now - self._last_pub_time < _CONTROL_MIN_INTERVAL:
+            return False  # retried next tick, with the newer values
+        self._publish_control(_CONTROL_FMT % (speed, angle))
+        self._last_pub_time = now
+        self._last_pub_speed = speed
+        self._last_pub_steering = angle
+        # Relative threshold, absolute near zero
+        self._speed_threshold = (speed * SPEED_PUBLISH_THRESHOLD
+                                 if speed > 0 else 0.5)
+        return False
 
     def _publish_obstacle(self):
-        payload = json.dumps({"event": "wheel_click", "timestamp": time.time()})
-        self.mqtt.publish("mouse/obstacle", payload)
-        print("[mouse_tracker] obstacle published")
+        # A fast wheel spin emits dozens of ticks: one obstacle per 50 ms
+        now = time.monotonic()
+        if now - self._last_obstacle < OBSTACLE_MIN_INTERVAL:
+            return
+        self._last_obstacle = now
+        self._publish_obstacle_msg(_OBSTACLE_FMT % time.time())
+        log.info("obstacle published")
@@ -8,11 +8,11 @@ const CONFIG = {
         port: 9001, // WebSocket port (default for MQTT over WebSocket)
         clientId: 'car_simulator_' + Math.random().toString(16).substr(2, 8),
         topics: {
-            mouseSpeed: 'mouse/speed',
-            mouseSteering: 'mouse/steering',
+            mouseControl: 'mouse/control',  // {speed, angle}
             mouseObstacle: 'mouse/obstacle',
             aiObjects: 'ai/objects',
-            aiDebug: 'ai/debug'
+            aiDebugAnnotated: 'ai/debug/annotated',  // raw JPEG bytes
+            aiDebugDepth: 'ai/debug/depth'           // raw JPEG bytes
         }
     },
 
@@ -133,10 +133,8 @@ class Game {
 
     handleMQTTMessage(type, data) {
         switch (type) {
-            case 'mouseSpeed':
+            case 'mouseControl':
                 this.state.worldSpeed = data.speed;
-                break;
-            case 'mouseSteering':
                 this.state.worldSteering = data.angle;
                 break;
             case 'mouseObstacle':
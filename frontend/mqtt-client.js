@@ -47,8 +47,7 @@ class MQTTClient {
         this.updateStatus(true);
 
         // Subscribe to all topics
-        this.subscribe(CONFIG.mqtt.topics.mouseSpeed);
-        this.subscribe(CONFIG.mqtt.topics.mouseSteering);
+        this.subscribe(CONFIG.mqtt.topics.mouseControl);
         this.subscribe(CONFIG.mqtt.topics.mouseObstacle);
         this.subscribe(CONFIG.mqtt.topics.aiObjects);
     }
@@ -101,12 +100,9 @@ class MQTTClient {
 
     // Handle different message types
     handleMessage(topic, data) {
-        if (topic === CONFIG.mqtt.topics.mouseSpeed) {
-            // Mouse speed control
-            this.onMessageCallback('mouseSpeed', data);
-        } else if (topic === CONFIG.mqtt.topics.mouseSteering) {
-            // Mouse steering control
-            this.onMessageCallback('mouseSteering', data);
+        if (topic === CONFIG.mqtt.topics.mouseControl) {
+            // Mouse speed + steering control
+            this.onMessageCallback('mouseControl', data);
         } else if (topic === CONFIG.mqtt.topics.mouseObstacle) {
             // User-added obstacle from mouse wheel
             this.onMessageCallback('mouseObstacle', data);
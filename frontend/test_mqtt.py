@@ -15,11 +15,13 @@ BROKER = "localhost"  # Change to your broker IP
 PORT = 1883
 
 # Topics
-TOPIC_SPEED = "mouse/speed"
-TOPIC_STEERING = "mouse/steering"
+TOPIC_CONTROL = "mouse/control"
 TOPIC_OBSTACLE = "mouse/obstacle"
 TOPIC_AI_OBJECTS = "ai/objects"
 
+# Pre-built payload template for one AI object (bytes %-formatting)
+_OBJ_TMPL = b'{"id":%d,"class":%d,"bbox":[%d,%d,%d,%d],"distance":%.2f}'
+
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
         print("Connected to MQTT broker")
@@ -30,13 +32,10 @@ def simulate_mouse_control(client):
     """Simulate mouse speed and steering inputs"""
     # Simulate varying speed (0-1)
     speed = abs(math.sin(time.time() * 0.5))
-    client.publish(TOPIC_SPEED, json.dumps({"speed": speed}))
-    print(f"Published speed: {speed:.2f}")
-    
     # Simulate steering (-45 to 45 degrees)
     steering = math.sin(time.time() * 0.3) * 45
-    client.publish(TOPIC_STEERING, json.dumps({"angle": steering}))
-    print(f"Published steering: {steering:.2f}°")
+    client.publish(TOPIC_CONTROL, json.dumps({"speed": speed, "angle": steering}))
+    print(f"Published speed: {speed:.2f}, steering: {steering:.2f}°")
 
 def simulate_user_obstacle(client):
     """Simulate user adding obstacle with mouse wheel"""
@@ -51,7 +50,6 @@ def simulate_ai_objects(client):
     """Simulate AI-detected objects"""
     # Generate 1-3 random objects
     num_objects = random.randint(1, 3)
-    objects = []
     
     classes = [
         (2, "car"),
@@ -62,22 +60,20 @@ def simulate_ai_objects(client):
         (7, "truck")
     ]
     
-    for i in range(num_objects):
-        class_id, class_name = random.choice(classes)
-        obj = {
-            "id": random.randint(1, 100),
-            "class": class_id,
-            "bbox": [
-                random.randint(100, 500),  # x
-                random.randint(100, 400),  # y
-                random.randint(50, 100),   # w
-                random.randint(50, 100)    # h
-            ],
-            "distance": random.uniform(2.0, 30.0)
-        }
-        objects.append(obj)
+    objects = (
+        _OBJ_TMPL % (
+            random.randint(1, 100),        # id
+            random.choice(classes)[0],     # class
+            random.randint(100, 500),      # x
+            random.randint(100, 400),      # y
+            random.randint(50, 100),       # w
+            random.randint(50, 100),       # h
+            random.uniform(2.0, 30.0),     # distance
+        )
+        for _ in range(num_objects)
+    )
     
-    client.publish(TOPIC_AI_OBJECTS, json.dumps(objects))
+    client.publish(TOPIC_AI_OBJECTS, b"[" + b",".join(objects) + b"]")
     print(f"Published {num_objects} AI objects")
 
 def main():